@@ -1,29 +1,54 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, Response, HTTPException
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, BinaryIO, Deque
 from datetime import datetime, timedelta, timezone
 from contextlib import asynccontextmanager
-from geopy.distance import distance
-from apscheduler.schedulers.background import BackgroundScheduler
-import requests
-import json
+from collections import defaultdict, deque
+from math import radians, sin, cos, asin, sqrt
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.executors.pool import ThreadPoolExecutor
+from cachetools import TTLCache
+from numba import njit, prange
+import numba
+import numpy as np
+import httpx
+import orjson
+import msgpack
+import simdjson
+import asyncio
+import hashlib
+import itertools
+import threading
+import sys
 import os
 
 STORAGE_DIR = "data"
 USERS_FILE = os.path.join(STORAGE_DIR, "users.json")
-ALERTS_FILE = os.path.join(STORAGE_DIR, "alerts.json")
-CACHE_FILE = os.path.join(STORAGE_DIR, "cache.json")
+ALERTS_FILE = os.path.join(STORAGE_DIR, "alerts.jsonl")
+LEGACY_ALERTS_FILE = os.path.join(STORAGE_DIR, "alerts.json")
+CACHE_FILE = os.path.join(STORAGE_DIR, "cache.msgpack")
+LEGACY_CACHE_FILE = os.path.join(STORAGE_DIR, "cache.json")
 LAST_ALERT_FILE = os.path.join(STORAGE_DIR, "last_alert.json")
 
 os.makedirs(STORAGE_DIR, exist_ok=True)
 
 USERS: Dict[str, Dict[str, Any]] = {}
-ALERTS: List[Dict[str, Any]] = []
-LAST_ALERT: Dict[str, str] = {}
+# Full history lives in the append-only alert log; memory keeps a bounded window.
+ALERTS_MAXLEN = 100_000
+ALERTS_PER_USER_MAXLEN = 1_000
+ALERTS: Deque[Dict[str, Any]] = deque(maxlen=ALERTS_MAXLEN)
+ALERTS_BY_USER: Dict[str, Deque[Dict[str, Any]]] = defaultdict(lambda: deque(maxlen=ALERTS_PER_USER_MAXLEN))
+# Total alerts ever logged; unlike len(ALERTS) it keeps growing once the deque is full.
+ALERTS_SEQ = 0
+LAST_ALERT: Dict[str, datetime] = {}
 CACHE: Dict[str, Any] = {
     "last_update": None,
-    "events": [],
-    "consecutive_failures": 0
+    "events_by_id": {},
+    "consecutive_failures": 0,
+    "etag": None,
+    "last_modified": None,
+    "payload_sha1": None,
 }
 
 RISK_RADIUS = {
@@ -34,79 +59,333 @@ RISK_RADIUS = {
     "Earthquake": 60,
 }
 
-scheduler: Optional[BackgroundScheduler] = None
+ORJSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+STATE_FLUSH_SECONDS = 30
+RESPONSE_CACHE_CONTROL = "public, max-age=10"
+PRIVATE_CACHE_CONTROL = "private, max-age=10"
+
+ALERTS_FH: Optional[BinaryIO] = None
+USERS_DIRTY = False
+LAST_ALERT_DIRTY = False
+CACHE_DIRTY = False
+
+GDACS_EVENTS_URL = "https://www.gdacs.org/gdacsapi/api/events"
+LAT_FIELDS = ("latitude", "lat")
+LON_FIELDS = ("longitude", "lon", "lng")
+TS_FIELDS = ("fromdate", "eventdate", "publisheddate", "date", "fromDate", "eventDate")
+END_TS_FIELDS = ("todate", "toDate", "enddate", "endDate")
+
+GDACS_CODE_MAP = {
+    "tc": sys.intern("Hurricane"),
+    "fl": sys.intern("Flood"),
+    "wf": sys.intern("Wildfire"),
+    "eq": sys.intern("Earthquake"),
+    "vo": sys.intern("Volcano"),
+    "dr": sys.intern("Drought"),
+}
+# Fallback for free-text titles, checked in order.
+GDACS_TYPE_KEYWORDS = (
+    ("fire", GDACS_CODE_MAP["wf"]),
+    ("storm", GDACS_CODE_MAP["tc"]),
+    ("cyclone", GDACS_CODE_MAP["tc"]),
+    ("hurricane", GDACS_CODE_MAP["tc"]),
+    ("typhoon", GDACS_CODE_MAP["tc"]),
+    ("flood", GDACS_CODE_MAP["fl"]),
+    ("volcano", GDACS_CODE_MAP["vo"]),
+    ("earthquake", GDACS_CODE_MAP["eq"]),
+)
+
+DEFAULT_RISK_RADIUS = 50
+RISK_TYPES = tuple(RISK_RADIUS)
+RISK_TYPE_INDEX = {disaster_type: i for i, disaster_type in enumerate(RISK_TYPES)}
+RISK_RADII = np.array([RISK_RADIUS[t] for t in RISK_TYPES], dtype=np.float64)
+RISK_CODES = (None, "Low", "Moderate", "High")
+# The kernel is launched from worker threads (scheduler pool, asyncio.to_thread). Numba would pick
+# tbb first, which hangs the interpreter at exit when used that way, so pin workqueue. Workqueue
+# does not support concurrent parallel launches, hence the lock.
+numba.config.THREADING_LAYER = "workqueue"
+MATCH_LOCK = threading.Lock()
+
+# Events are alerted on from ALERT_HORIZON_FUTURE before they start until
+# ALERT_HORIZON_PAST after they end. GDACS "iscurrent" events always count;
+# without an end date, the end is estimated from the start plus a typical duration.
+ALERT_HORIZON_PAST = timedelta(hours=24)
+ALERT_HORIZON_FUTURE = timedelta(days=7)
+EVENT_TYPE_DURATION = {
+    "Hurricane": timedelta(days=10),
+    "Flood": timedelta(days=14),
+    "Wildfire": timedelta(days=21),
+    "Tornado": timedelta(days=1),
+    "Earthquake": timedelta(days=3),
+}
+
+PROXIMITY_LABELS = {
+    "High": "Immediate Danger",
+    "Moderate": "Caution Zone",
+    "Low": "Informational",
+}
+
+EARTH_RADIUS_MILES = 3958.75
+MILES_PER_DEGREE_LAT = 69.0
+
+USER_IDS: List[str] = []
+USER_INDEX: Dict[str, int] = {}
+USER_LATS = np.empty(0, dtype=np.float64)
+USER_LONS = np.empty(0, dtype=np.float64)
+
+# Only the handful of fields we read per event are materialized from the
+# lazy document; a parser can hold one document at a time.
+GDACS_JSON_PARSER = simdjson.Parser()
+
+IP_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=86400)
+
+APP_HTTP: Optional[httpx.AsyncClient] = None
+scheduler: Optional[AsyncIOScheduler] = None
+job_executor: Optional[ThreadPoolExecutor] = None
 
 def load_data() -> None:
-    global USERS, ALERTS, LAST_ALERT, CACHE
+    global USERS, ALERTS, ALERTS_BY_USER, ALERTS_SEQ, LAST_ALERT, CACHE
     
     try:
         if os.path.exists(USERS_FILE):
-            with open(USERS_FILE, 'r') as f:
-                USERS = json.load(f)
+            with open(USERS_FILE, 'rb') as f:
+                USERS = orjson.loads(f.read())
             print(f"Loaded {len(USERS)} users from disk")
     except Exception as e:
         print(f"Failed to load users: {e}")
         USERS = {}
+    refresh_user_arrays()
     
     try:
         if os.path.exists(ALERTS_FILE):
-            with open(ALERTS_FILE, 'r') as f:
-                ALERTS = json.load(f)
+            ALERTS = deque(maxlen=ALERTS_MAXLEN)
+            ALERTS_SEQ = 0
+            with open(ALERTS_FILE, 'rb+') as f:
+                line = b"\n"
+                line_ok = True
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        ALERTS.append(orjson.loads(line))
+                    except orjson.JSONDecodeError:
+                        line_ok = False
+                        continue
+                    line_ok = True
+                    ALERTS_SEQ += 1
+                # A crash mid-append leaves an unterminated last line; fix it up so the next
+                # append starts on a fresh line instead of being glued onto it.
+                if not line.endswith(b"\n"):
+                    f.seek(0, os.SEEK_END)
+                    if line_ok:
+                        f.write(b"\n")
+                    else:
+                        f.truncate(f.tell() - len(line))
+                        print("Dropped truncated record at end of alert log")
             print(f"Loaded {len(ALERTS)} alerts from disk")
+        elif os.path.exists(LEGACY_ALERTS_FILE):
+            with open(LEGACY_ALERTS_FILE, 'rb') as f:
+                legacy_alerts = orjson.loads(f.read())
+            with open(ALERTS_FILE, 'wb') as f:
+                f.writelines(orjson.dumps(alert) + b"\n" for alert in legacy_alerts)
+            ALERTS = deque(legacy_alerts, maxlen=ALERTS_MAXLEN)
+            ALERTS_SEQ = len(legacy_alerts)
+            print(f"Migrated {len(legacy_alerts)} alerts from {LEGACY_ALERTS_FILE}")
     except Exception as e:
         print(f"Failed to load alerts: {e}")
-        ALERTS = []
+        ALERTS = deque(maxlen=ALERTS_MAXLEN)
+        ALERTS_SEQ = 0
+    ALERTS_BY_USER = defaultdict(lambda: deque(maxlen=ALERTS_PER_USER_MAXLEN))
+    for alert in ALERTS:
+        ALERTS_BY_USER[alert.get("user_id")].append(alert)
     
     try:
         if os.path.exists(LAST_ALERT_FILE):
-            with open(LAST_ALERT_FILE, 'r') as f:
-                LAST_ALERT = json.load(f)
+            with open(LAST_ALERT_FILE, 'rb') as f:
+                raw_last_alert = orjson.loads(f.read())
+            LAST_ALERT = {}
+            for user_id, last_str in raw_last_alert.items():
+                last = parse_event_timestamp(last_str)
+                if last is not None:
+                    LAST_ALERT[user_id] = last
     except Exception as e:
         print(f"Failed to load last_alert: {e}")
         LAST_ALERT = {}
     
     try:
+        loaded_cache = None
         if os.path.exists(CACHE_FILE):
-            with open(CACHE_FILE, 'r') as f:
-                CACHE = json.load(f)
+            with open(CACHE_FILE, 'rb') as f:
+                loaded_cache = msgpack.unpack(f, raw=False)
+        elif os.path.exists(LEGACY_CACHE_FILE):
+            with open(LEGACY_CACHE_FILE, 'rb') as f:
+                loaded_cache = orjson.loads(f.read())
+            print(f"Migrating cache from {LEGACY_CACHE_FILE}")
+        if loaded_cache is not None:
+            CACHE = loaded_cache
             if "consecutive_failures" not in CACHE:
                 CACHE["consecutive_failures"] = 0
-            print(f"Loaded cache with {len(CACHE.get('events', []))} events")
+            loaded_events = CACHE.pop("events", None) or list(CACHE.get("events_by_id", {}).values())
+            CACHE["events_by_id"] = {}
+            for event in loaded_events:
+                if not event.get("key"):
+                    event["key"] = gdacs_event_key(event.get("type"), event.get("id"), event.get("coordinates"), event.get("timestamp"))
+                CACHE["events_by_id"][event["key"]] = event
+                event["_ts_dt"] = parse_event_timestamp(event.get("timestamp"))
+                event["_end_dt"] = parse_event_timestamp(event.get("end_timestamp"))
+            print(f"Loaded cache with {len(CACHE['events_by_id'])} events")
     except Exception as e:
         print(f"Failed to load cache: {e}")
-        CACHE = {"last_update": None, "events": [], "consecutive_failures": 0}
+        CACHE = {"last_update": None, "events_by_id": {}, "consecutive_failures": 0}
+
+
+def refresh_user_arrays() -> None:
+    global USER_IDS, USER_INDEX, USER_LATS, USER_LONS
+
+    user_ids: List[str] = []
+    lats: List[float] = []
+    lons: List[float] = []
+    for user_id, user in USERS.items():
+        try:
+            lat = float(user.get("lat"))
+            lon = float(user.get("lon"))
+        except (ValueError, TypeError):
+            continue
+        user_ids.append(user_id)
+        lats.append(lat)
+        lons.append(lon)
+
+    USER_INDEX = {user_id: i for i, user_id in enumerate(user_ids)}
+    USER_IDS = user_ids
+    USER_LATS = np.array(lats, dtype=np.float64)
+    USER_LONS = np.array(lons, dtype=np.float64)
+
 
+def upsert_user_coords(user_id: str, lat: float, lon: float) -> None:
+    global USER_LATS, USER_LONS
+    
+    idx = USER_INDEX.get(user_id)
+    if idx is not None:
+        USER_LATS[idx] = lat
+        USER_LONS[idx] = lon
+        return
+    
+    # Grow the coordinate arrays before publishing the id so a concurrent
+    # processing pass never sees an index without coordinates.
+    USER_LATS = np.append(USER_LATS, lat)
+    USER_LONS = np.append(USER_LONS, lon)
+    USER_INDEX[user_id] = len(USER_IDS)
+    USER_IDS.append(user_id)
+
+
+def write_file_atomic(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
 
-def save_users() -> None:
+
+def write_json_atomic(path: str, obj: Any) -> None:
+    write_file_atomic(path, orjson.dumps(obj, option=ORJSON_OPTIONS))
+
+
+def save_users() -> bool:
     try:
-        with open(USERS_FILE, 'w') as f:
-            json.dump(USERS, f, indent=2)
+        # Copy first: flush_job writes from a worker thread while subscribes keep landing.
+        write_json_atomic(USERS_FILE, dict(USERS))
+        return True
     except Exception as e:
         print(f"Failed to save users: {e}")
+        return False
 
 
-def save_alerts() -> None:
+def open_alert_log() -> None:
+    global ALERTS_FH
+    if ALERTS_FH is None:
+        ALERTS_FH = open(ALERTS_FILE, 'ab')
+
+
+def close_alert_log() -> None:
+    global ALERTS_FH
+    if ALERTS_FH is not None:
+        ALERTS_FH.close()
+        ALERTS_FH = None
+
+
+def append_alert(payload: Dict[str, Any]) -> None:
+    global ALERTS_SEQ
+    ALERTS.append(payload)
+    ALERTS_SEQ += 1
+    ALERTS_BY_USER[payload["user_id"]].append(payload)
     try:
-        with open(ALERTS_FILE, 'w') as f:
-            json.dump(ALERTS, f, indent=2)
+        open_alert_log()
+        ALERTS_FH.write(orjson.dumps(payload) + b"\n")
+        ALERTS_FH.flush()
     except Exception as e:
-        print(f"Failed to save alerts: {e}")
+        print(f"Failed to append alert: {e}")
+
 
+def recent_alerts(limit: int) -> List[Dict[str, Any]]:
+    # Walk from the newest end so the cost is O(limit), not O(len(ALERTS)).
+    recent = list(itertools.islice(reversed(ALERTS), max(0, limit)))
+    recent.reverse()
+    return recent
 
-def save_last_alert() -> None:
+
+def save_last_alert() -> bool:
     try:
-        with open(LAST_ALERT_FILE, 'w') as f:
-            json.dump(LAST_ALERT, f, indent=2)
+        # list() snapshots in one C call; the process job may insert keys concurrently.
+        snapshot = list(LAST_ALERT.items())
+        write_json_atomic(LAST_ALERT_FILE, {user_id: last.isoformat() for user_id, last in snapshot})
+        return True
     except Exception as e:
         print(f"Failed to save last_alert: {e}")
+        return False
 
 
-def save_cache() -> None:
+def save_cache() -> bool:
     try:
-        with open(CACHE_FILE, 'w') as f:
-            json.dump(CACHE, f, indent=2, default=str)
+        # "_"-prefixed event keys are derived in memory (rehydrated by load_data); don't persist them.
+        snapshot = dict(CACHE)
+        snapshot["events_by_id"] = {
+            event_key: {k: v for k, v in list(event.items()) if not k.startswith("_")}
+            for event_key, event in list(CACHE.get("events_by_id", {}).items())
+        }
+        write_file_atomic(CACHE_FILE, msgpack.packb(snapshot, default=str, use_bin_type=True))
+        return True
     except Exception as e:
         print(f"Failed to save cache: {e}")
+        return False
+
+
+def flush_state() -> None:
+    global USERS_DIRTY, LAST_ALERT_DIRTY, CACHE_DIRTY
+    
+    # Clear before saving so updates made during the write stay pending,
+    # and re-mark on failure so the next flush retries.
+    if USERS_DIRTY:
+        USERS_DIRTY = False
+        if not save_users():
+            USERS_DIRTY = True
+    if LAST_ALERT_DIRTY:
+        LAST_ALERT_DIRTY = False
+        if not save_last_alert():
+            LAST_ALERT_DIRTY = True
+    if CACHE_DIRTY:
+        CACHE_DIRTY = False
+        if not save_cache():
+            CACHE_DIRTY = True
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global APP_HTTP
+    if APP_HTTP is None:
+        APP_HTTP = httpx.AsyncClient(
+            timeout=10,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20),
+        )
+    return APP_HTTP
 
 
 class SubscribeRequest(BaseModel):
@@ -121,192 +400,162 @@ class PushNotificationRequest(BaseModel):
     message: str
 
 
-def map_gdacs_type(gdacs_title: str) -> str:
-    title = gdacs_title.lower()
-    if "fire" in title or "wildfire" in title:
-        return "Wildfire"
-    if "storm" in title or "cyclone" in title or "hurricane" in title or "typhoon" in title:
-        return "Hurricane"
-    if "flood" in title:
-        return "Flood"
-    if "volcano" in title:
-        return "Volcano"
-    if "earthquake" in title:
-        return "Earthquake"
-    return gdacs_title
-
-
-def fetch_recent_gdacs_events(since: datetime) -> List[Dict[str, Any]]:
-    url = "https://www.gdacs.org/gdacsapi/api/events"
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-    except Exception as e:
-        print(f"GDACS resync fetch failed: {e}")
-        return []
-
-    events: List[Dict[str, Any]] = []
-    if isinstance(data, dict):
-        data = data.get("results", [])
-    
-    for ev in data:
-        lat = ev.get("latitude")
-        if lat is None:
-            lat = ev.get("lat")
-        lon = ev.get("longitude")
-        if lon is None:
-            lon = ev.get("lon")
-        if lon is None:
-            lon = ev.get("lng")
-        if lat is None or lon is None:
-            continue
-
-        try:
-            lat_float = float(lat)
-            lon_float = float(lon)
-        except (ValueError, TypeError):
-            continue
+def gdacs_event_key(type_code: Any, event_id: Any, coordinates: Any, timestamp: Any) -> str:
+    # GDACS numbers events per type, so the id alone is not unique across a feed.
+    if event_id:
+        return f"{type_code}:{event_id}"
+    lat, lon = coordinates
+    return f"{type_code}:{float(lat):.4f},{float(lon):.4f}:{timestamp}"
 
-        disaster_type = ev.get("eventtype") or ev.get("title") or ev.get("eventType") or "Disaster"
-        mapped_type = map_gdacs_type(disaster_type)
-        
-        event_timestamp = None
-        for ts_field in ["fromdate", "eventdate", "publisheddate", "date", "fromDate", "eventDate"]:
-            ts_value = ev.get(ts_field)
-            if ts_value:
-                try:
-                    if isinstance(ts_value, str):
-                        event_timestamp = datetime.fromisoformat(ts_value.replace('Z', '+00:00')).isoformat()
-                    elif isinstance(ts_value, (int, float)):
-                        if ts_value > 1e10:
-                            event_timestamp = datetime.fromtimestamp(ts_value / 1000.0, tz=timezone.utc).isoformat()
-                        else:
-                            event_timestamp = datetime.fromtimestamp(ts_value, tz=timezone.utc).isoformat()
-                    break
-                except (ValueError, TypeError, OSError):
-                    continue
-        
-        if event_timestamp is None:
-            event_timestamp = datetime.now(timezone.utc).isoformat()
-        
-        try:
-            event_dt = datetime.fromisoformat(event_timestamp.replace('Z', '+00:00'))
-            if event_dt.tzinfo is None:
-                event_dt = event_dt.replace(tzinfo=timezone.utc)
-            if event_dt >= since:
-                events.append({
-                    "id": str(ev.get("eventid") or ev.get("id") or ev.get("eventId", "")),
-                    "type": mapped_type,
-                    "coordinates": [lat_float, lon_float],
-                    "severity": ev.get("alertlevel") or ev.get("alertLevel") or "unknown",
-                    "timestamp": event_timestamp,
-                })
-        except (ValueError, TypeError):
-            events.append({
-                "id": str(ev.get("eventid") or ev.get("id") or ev.get("eventId", "")),
-                "type": mapped_type,
-                "coordinates": [lat_float, lon_float],
-                "severity": ev.get("alertlevel") or ev.get("alertLevel") or "unknown",
-                "timestamp": event_timestamp,
-            })
 
-    return events
+def map_gdacs_type(gdacs_title: str) -> str:
+    title = gdacs_title.lower()
+    mapped = GDACS_CODE_MAP.get(title)
+    if mapped is not None:
+        return mapped
+    for keyword, disaster_type in GDACS_TYPE_KEYWORDS:
+        if keyword in title:
+            return disaster_type
+    return sys.intern(gdacs_title)
+
+
+def first_present(ev: Any, fields: Tuple[str, ...]) -> Any:
+    for field in fields:
+        value = ev.get(field)
+        if value is not None:
+            return value
+    return None
 
 
-def fetch_gdacs_events() -> List[Dict[str, Any]]:
-    url = "https://www.gdacs.org/gdacsapi/api/events"
+def parse_gdacs_timestamp(ev: Any, fields: Tuple[str, ...] = TS_FIELDS) -> Optional[datetime]:
+    event_dt = None
+    for ts_field in fields:
+        ts_value = ev.get(ts_field)
+        if ts_value:
+            try:
+                if isinstance(ts_value, str):
+                    event_dt = datetime.fromisoformat(ts_value.replace('Z', '+00:00'))
+                elif isinstance(ts_value, (int, float)):
+                    if ts_value > 1e10:
+                        event_dt = datetime.fromtimestamp(ts_value / 1000.0, tz=timezone.utc)
+                    else:
+                        event_dt = datetime.fromtimestamp(ts_value, tz=timezone.utc)
+                break
+            except (ValueError, TypeError, OSError):
+                continue
+    
+    if event_dt is None:
+        return None
+    if event_dt.tzinfo is None:
+        event_dt = event_dt.replace(tzinfo=timezone.utc)
+    return event_dt
+
+
+def parse_gdacs_flag(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes")
+    return bool(value)
+
+
+async def fetch_gdacs_events(since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    # The resync pass (since set) always needs the full body, so only the
+    # primary fetch uses conditional headers and the payload digest.
+    primary = since is None
+    label = "GDACS fetch" if primary else "GDACS resync fetch"
+    headers: Dict[str, str] = {}
+    if primary and CACHE.get("events_by_id"):
+        if CACHE.get("etag"):
+            headers["If-None-Match"] = CACHE["etag"]
+        if CACHE.get("last_modified"):
+            headers["If-Modified-Since"] = CACHE["last_modified"]
+    
     try:
-        resp = requests.get(url, timeout=10)
+        resp = await get_http_client().get(GDACS_EVENTS_URL, headers=headers)
+        if primary and resp.status_code == 304:
+            print("GDACS feed not modified - reusing cached events")
+            return list(CACHE["events_by_id"].values())
         resp.raise_for_status()
-        data = resp.json()
+        
+        payload_sha1 = None
+        if primary:
+            CACHE["etag"] = resp.headers.get("ETag")
+            CACHE["last_modified"] = resp.headers.get("Last-Modified")
+            payload_sha1 = hashlib.sha1(resp.content).hexdigest()
+            if CACHE.get("events_by_id") and payload_sha1 == CACHE.get("payload_sha1"):
+                print("GDACS feed unchanged - reusing cached events")
+                return list(CACHE["events_by_id"].values())
+        
+        data = GDACS_JSON_PARSER.parse(resp.content)
     except Exception as e:
-        print(f"GDACS fetch failed: {e}")
+        print(f"{label} failed: {e}")
         return []
 
     events: List[Dict[str, Any]] = []
-
-    if isinstance(data, dict):
+    if isinstance(data, simdjson.Object):
         data = data.get("results", [])
     
     for ev in data:
-        lat = ev.get("latitude")
+        lat = first_present(ev, LAT_FIELDS)
         if lat is None:
-            lat = ev.get("lat")
-        lon = ev.get("longitude")
-        if lon is None:
-            lon = ev.get("lon")
+            continue
+        lon = first_present(ev, LON_FIELDS)
         if lon is None:
-            lon = ev.get("lng")
-        if lat is None or lon is None:
             continue
-
         try:
             lat_float = float(lat)
             lon_float = float(lon)
         except (ValueError, TypeError):
             continue
 
-        disaster_type = ev.get("eventtype") or ev.get("title") or ev.get("eventType") or "Disaster"
-        mapped_type = map_gdacs_type(disaster_type)
-        
-        event_timestamp = None
-        for ts_field in ["fromdate", "eventdate", "publisheddate", "date", "fromDate", "eventDate"]:
-            ts_value = ev.get(ts_field)
-            if ts_value:
-                try:
-                    if isinstance(ts_value, str):
-                        event_timestamp = datetime.fromisoformat(ts_value.replace('Z', '+00:00')).isoformat()
-                    elif isinstance(ts_value, (int, float)):
-                        if ts_value > 1e10:
-                            event_timestamp = datetime.fromtimestamp(ts_value / 1000.0, tz=timezone.utc).isoformat()
-                        else:
-                            event_timestamp = datetime.fromtimestamp(ts_value, tz=timezone.utc).isoformat()
-                    break
-                except (ValueError, TypeError, OSError):
-                    continue
-        
-        if event_timestamp is None:
-            event_timestamp = datetime.now(timezone.utc).isoformat()
+        event_dt = parse_gdacs_timestamp(ev) or datetime.now(timezone.utc)
+        if since is not None and event_dt < since:
+            continue
+        end_dt = parse_gdacs_timestamp(ev, END_TS_FIELDS)
 
+        disaster_type = ev.get("eventtype") or ev.get("title") or ev.get("eventType") or "Disaster"
+        event_id = str(ev.get("eventid") or ev.get("id") or ev.get("eventId", ""))
+        type_code = ev.get("eventtype") or ev.get("eventType") or disaster_type
         events.append({
-            "id": str(ev.get("eventid") or ev.get("id") or ev.get("eventId", "")),
-            "type": mapped_type,
+            "key": gdacs_event_key(type_code, event_id, (lat_float, lon_float), event_dt.isoformat()),
+            "id": event_id,
+            "type": map_gdacs_type(disaster_type),
             "coordinates": [lat_float, lon_float],
             "severity": ev.get("alertlevel") or ev.get("alertLevel") or "unknown",
-            "timestamp": event_timestamp,
+            "timestamp": event_dt.isoformat(),
+            "end_timestamp": end_dt.isoformat() if end_dt else None,
+            "is_current": parse_gdacs_flag(ev.get("iscurrent") or ev.get("isCurrent")),
+            "_ts_dt": event_dt,
+            "_end_dt": end_dt,
         })
 
+    if primary:
+        CACHE["payload_sha1"] = payload_sha1
     return events
 
 
-def fetch_disaster_data() -> List[Dict[str, Any]]:
-    return fetch_gdacs_events()
+async def fetch_disaster_data() -> List[Dict[str, Any]]:
+    return await fetch_gdacs_events()
 
 
-def safe_update_events() -> None:
-    global CACHE
+async def safe_update_events() -> None:
+    global CACHE, CACHE_DIRTY
     
     try:
-        events = fetch_disaster_data()
+        events = await fetch_disaster_data()
+        events_by_id = {event["key"]: event for event in events}
         
         if CACHE.get("consecutive_failures", 0) > 1:
             print("Network restored - resyncing last 24 hours...")
             since = datetime.now(timezone.utc) - timedelta(hours=24)
-            recent_events = fetch_recent_gdacs_events(since)
-            
-            existing_ids = {e.get("id") for e in CACHE.get("events", [])}
-            for event in recent_events:
-                if event.get("id") not in existing_ids:
-                    events.append(event)
-            
+            recent_events = await fetch_gdacs_events(since)
+            events_by_id.update({event["key"]: event for event in recent_events})
             print(f"Resynced {len(recent_events)} events from last 24 hours")
         
-        CACHE["events"] = events
+        CACHE["events_by_id"] = events_by_id
         CACHE["last_update"] = datetime.now(timezone.utc).isoformat()
         CACHE["consecutive_failures"] = 0
-        save_cache()
-        print(f"[{datetime.now(timezone.utc)}] events updated: {len(events)}")
+        CACHE_DIRTY = True
+        print(f"[{datetime.now(timezone.utc)}] events updated: {len(events_by_id)}")
     except Exception as e:
         CACHE["consecutive_failures"] = CACHE.get("consecutive_failures", 0) + 1
         
@@ -315,16 +564,20 @@ def safe_update_events() -> None:
         else:
             print(f"[{datetime.now(timezone.utc)}] error updating events - using cached events: {e}")
         
-        save_cache()
+        CACHE_DIRTY = True
 
 
-def get_user_location_from_ip(ip: str) -> Optional[Dict[str, float]]:
+async def get_user_location_from_ip(ip: str) -> Optional[Dict[str, float]]:
     if ip in ["127.0.0.1", "localhost", "::1"] or ip.startswith("192.168.") or ip.startswith("10."):
         return None
     
+    if ip in IP_CACHE:
+        return IP_CACHE[ip]
+    
+    location = None
     try:
         url = f"https://ipapi.co/{ip}/json/"
-        resp = requests.get(url, timeout=5)
+        resp = await get_http_client().get(url, timeout=5)
         resp.raise_for_status()
         data = resp.json()
         
@@ -336,19 +589,95 @@ def get_user_location_from_ip(ip: str) -> Optional[Dict[str, float]]:
             region = data.get("region", "Unknown")
             country = data.get("country_name", "Unknown")
             print(f"Detected location for IP {ip}: {city}, {region}, {country} ({lat}, {lon})")
-            return {"lat": float(lat), "lon": float(lon)}
+            location = {"lat": float(lat), "lon": float(lon)}
     except Exception as e:
         print(f"IP geolocation failed for {ip}: {e}")
     
-    return None
+    IP_CACHE[ip] = location
+    return location
 
 
 def calculate_distance_miles(user_coords: tuple, disaster_coords: tuple) -> float:
-    return distance(user_coords, disaster_coords).miles
+    lat1, lon1 = map(radians, user_coords)
+    lat2, lon2 = map(radians, disaster_coords)
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * asin(sqrt(a))
+
+
+@njit(inline="always", fastmath=True, cache=True)
+def _pair_risk_code(ulat, ulon, ulat_r, ulon_r, cos_ulat, elat, elon, elat_r, elon_r, cos_elat, lat_tol, lon_tol, radius):
+    # Cheap degree-space bounding box before any trig; longitude wraps at the antimeridian.
+    if abs(ulat - elat) >= lat_tol:
+        return 0
+    if abs((ulon - elon + 180.0) % 360.0 - 180.0) >= lon_tol:
+        return 0
+
+    a = np.sin((elat_r - ulat_r) / 2) ** 2 + cos_ulat * cos_elat * np.sin((elon_r - ulon_r) / 2) ** 2
+    dist = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+    if dist <= 0.5 * radius:
+        return 3
+    elif dist <= radius:
+        return 2
+    elif dist <= 1.5 * radius:
+        return 1
+    return 0
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def match_users_to_events(ulat, ulon, elat, elon, etype, radii):
+    n_users = ulat.shape[0]
+    n_events = elat.shape[0]
+
+    ulat_r = np.radians(ulat)
+    ulon_r = np.radians(ulon)
+    cos_ulat = np.cos(ulat_r)
+    elat_r = np.radians(elat)
+    elon_r = np.radians(elon)
+    cos_elat = np.cos(elat_r)
+    ev_radii = radii[etype]
+    lat_tol = 1.5 * ev_radii / MILES_PER_DEGREE_LAT
+    # Exact half-width in longitude of a spherical cap: asin(sin(d) / cos(lat)), plus a
+    # 1% margin. Once the cap reaches a pole every longitude is in range.
+    span = np.sin(1.5 * ev_radii / EARTH_RADIUS_MILES) / np.maximum(cos_elat, 1e-12)
+    lon_tol = np.where(span >= 1.0, 360.0, np.degrees(np.arcsin(np.minimum(span, 1.0))) * 1.01)
+
+    # Two passes (count, then fill) so each user writes its hits without locking.
+    counts = np.zeros(n_users, dtype=np.int64)
+    for i in prange(n_users):
+        c = 0
+        for j in range(n_events):
+            if _pair_risk_code(ulat[i], ulon[i], ulat_r[i], ulon_r[i], cos_ulat[i],
+                               elat[j], elon[j], elat_r[j], elon_r[j], cos_elat[j],
+                               lat_tol[j], lon_tol[j], ev_radii[j]) > 0:
+                c += 1
+        counts[i] = c
+
+    offsets = np.zeros(n_users + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    total = offsets[n_users]
+    user_idx = np.empty(total, dtype=np.int32)
+    event_idx = np.empty(total, dtype=np.int32)
+    risk_code = np.empty(total, dtype=np.int8)
+
+    for i in prange(n_users):
+        k = offsets[i]
+        for j in range(n_events):
+            code = _pair_risk_code(ulat[i], ulon[i], ulat_r[i], ulon_r[i], cos_ulat[i],
+                                   elat[j], elon[j], elat_r[j], elon_r[j], cos_elat[j],
+                                   lat_tol[j], lon_tol[j], ev_radii[j])
+            if code > 0:
+                user_idx[k] = i
+                event_idx[k] = j
+                risk_code[k] = code
+                k += 1
+
+    return user_idx, event_idx, risk_code
 
 
 def categorize_risk(user_dist: float, disaster_type: str) -> Optional[str]:
-    base_radius = RISK_RADIUS.get(disaster_type, 50)
+    base_radius = RISK_RADIUS.get(disaster_type, DEFAULT_RISK_RADIUS)
     if user_dist <= 0.5 * base_radius:
         return "High"
     elif user_dist <= base_radius:
@@ -359,24 +688,28 @@ def categorize_risk(user_dist: float, disaster_type: str) -> Optional[str]:
 
 
 def classify_proximity(risk_level: str) -> str:
-    if risk_level == "High":
-        return "Immediate Danger"
-    elif risk_level == "Moderate":
-        return "Caution Zone"
-    elif risk_level == "Low":
-        return "Informational"
-    return "Unknown"
+    return PROXIMITY_LABELS.get(risk_level, "Unknown")
 
 
-def classify_alert_level(event_timestamp: str) -> Tuple[str, str]:
+def parse_event_timestamp(event_timestamp: Any) -> Optional[datetime]:
+    if isinstance(event_timestamp, datetime):
+        event_dt = event_timestamp
+    elif isinstance(event_timestamp, str):
+        try:
+            event_dt = datetime.fromisoformat(event_timestamp.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    else:
+        return None
+    if event_dt.tzinfo is None:
+        event_dt = event_dt.replace(tzinfo=timezone.utc)
+    return event_dt
+
+
+def classify_alert_level(event_timestamp: Any) -> Tuple[str, str]:
     try:
-        if isinstance(event_timestamp, str):
-            if event_timestamp.endswith('Z'):
-                event_timestamp = event_timestamp.replace('Z', '+00:00')
-            event_dt = datetime.fromisoformat(event_timestamp)
-            if event_dt.tzinfo is None:
-                event_dt = event_dt.replace(tzinfo=timezone.utc)
-        else:
+        event_dt = parse_event_timestamp(event_timestamp)
+        if event_dt is None:
             return ("Emergency", "Unknown time")
         
         now = datetime.now(timezone.utc)
@@ -400,33 +733,25 @@ def classify_alert_level(event_timestamp: str) -> Tuple[str, str]:
 
 
 def should_send_alert(user_id: str, min_hours: int = 6) -> bool:
+    global LAST_ALERT_DIRTY
+
     now = datetime.now(timezone.utc)
-    last_str = LAST_ALERT.get(user_id)
-    
-    if not last_str:
-        LAST_ALERT[user_id] = now.isoformat()
-        save_last_alert()
-        return True
+    last = LAST_ALERT.get(user_id)
     
-    try:
-        last = datetime.fromisoformat(last_str.replace('Z', '+00:00'))
-        if last.tzinfo is None:
-            last = last.replace(tzinfo=timezone.utc)
-        if (now - last) > timedelta(hours=min_hours):
-            LAST_ALERT[user_id] = now.isoformat()
-            save_last_alert()
-            return True
-    except (ValueError, TypeError):
-        LAST_ALERT[user_id] = now.isoformat()
-        save_last_alert()
+    if last is None or (now - last) > timedelta(hours=min_hours):
+        LAST_ALERT[user_id] = now
+        LAST_ALERT_DIRTY = True
         return True
     
     return False
 
 
 def send_alert(user: Dict[str, Any], event: Dict[str, Any], risk_level: str) -> None:
-    alert_level, time_desc = classify_alert_level(event.get("timestamp"))
-    proximity_label = classify_proximity(risk_level)
+    alert_tuple = event.get("_alert_tuple")
+    if alert_tuple is None:
+        alert_tuple = classify_alert_level(event.get("_ts_dt") or event.get("timestamp"))
+    alert_level, time_desc = alert_tuple
+    proximity_label = PROXIMITY_LABELS.get(risk_level, "Unknown")
     
     payload = {
         "user_id": user["user_id"],
@@ -440,84 +765,139 @@ def send_alert(user: Dict[str, Any], event: Dict[str, Any], risk_level: str) ->
         "event_id": event.get("id", "unknown"),
         "timestamp": datetime.now(timezone.utc).isoformat(),
     }
-    ALERTS.append(payload)
-    save_alerts()
+    append_alert(payload)
     
     print(f"[{alert_level}][{proximity_label}] alert -> {user['name']} | {event['type']} | {risk_level} risk | ({time_desc})")
 
 
+def _is_stale(event: Dict[str, Any], now: datetime) -> bool:
+    start_dt = event.get("_ts_dt")
+    if start_dt is None or start_dt > now + ALERT_HORIZON_FUTURE:
+        return True
+    if event.get("is_current"):
+        return False
+    end_dt = event.get("_end_dt") or start_dt + EVENT_TYPE_DURATION.get(event.get("type"), timedelta(0))
+    return end_dt < now - ALERT_HORIZON_PAST
+
+
 def process_events_for_users() -> None:
-    if not CACHE["events"]:
+    if not CACHE["events_by_id"]:
         return
 
-    for event in CACHE["events"]:
-        if "coordinates" not in event or not isinstance(event["coordinates"], (list, tuple)) or len(event["coordinates"]) != 2:
+    user_lats, user_lons, user_ids = USER_LATS, USER_LONS, USER_IDS
+    # A subscribe may be mid-append; only consider the users every array covers.
+    n_users = min(len(user_lats), len(user_lons), len(user_ids))
+    if n_users == 0:
+        return
+    user_lats = user_lats[:n_users]
+    user_lons = user_lons[:n_users]
+
+    now = datetime.now(timezone.utc)
+    active_events = [
+        event for event in list(CACHE["events_by_id"].values())
+        if event.get("type") in RISK_TYPE_INDEX and not _is_stale(event, now)
+    ]
+
+    events: List[Dict[str, Any]] = []
+    ev_lats: List[float] = []
+    ev_lons: List[float] = []
+    ev_types: List[int] = []
+    for event in active_events:
+        coords = event.get("coordinates")
+        if not isinstance(coords, (list, tuple)) or len(coords) != 2:
             continue
-        
-        event_type = event["type"]
-        event_coords = tuple(event["coordinates"])
+        try:
+            ev_lat = float(coords[0])
+            ev_lon = float(coords[1])
+        except (ValueError, TypeError):
+            continue
+        events.append(event)
+        ev_lats.append(ev_lat)
+        ev_lons.append(ev_lon)
+        ev_types.append(RISK_TYPE_INDEX[event["type"]])
 
-        for user_id, user in USERS.items():
-            try:
-                user_lat = user.get("lat")
-                user_lon = user.get("lon")
-                if user_lat is None or user_lon is None:
-                    continue
-                
-                try:
-                    float(event_coords[0])
-                    float(event_coords[1])
-                    float(user_lat)
-                    float(user_lon)
-                except (ValueError, TypeError):
-                    continue
-                
-                user_coords = (user_lat, user_lon)
-                dist = calculate_distance_miles(user_coords, event_coords)
-                risk = categorize_risk(dist, event_type)
-
-                if risk and should_send_alert(user_id):
-                    send_alert(user, event, risk)
-            except Exception as e:
-                print(f"Error processing event {event.get('id', 'unknown')} for user {user_id}: {e}")
-                continue
+    if not events:
+        return
+
+    # Alert level only depends on the event time, so classify once per event
+    # per pass instead of once per matched user.
+    for event in events:
+        event["_alert_tuple"] = classify_alert_level(event.get("_ts_dt") or event.get("timestamp"))
+
+    with MATCH_LOCK:
+        user_idx, event_idx, risk_code = match_users_to_events(
+            user_lats, user_lons,
+            np.array(ev_lats, dtype=np.float64), np.array(ev_lons, dtype=np.float64),
+            np.array(ev_types, dtype=np.int64), RISK_RADII,
+        )
+
+    # Hits come back grouped by user; walk them event-major so rate limiting
+    # picks the same event per user as a per-event loop would.
+    order = np.argsort(event_idx, kind="stable")
+    for ev_i, user_i, code in zip(event_idx[order].tolist(), user_idx[order].tolist(), risk_code[order].tolist()):
+        event = events[ev_i]
+        user_id = user_ids[user_i]
+        try:
+            user = USERS[user_id]
+            risk = RISK_CODES[code]
+
+            if should_send_alert(user_id):
+                send_alert(user, event, risk)
+        except Exception as e:
+            print(f"Error processing event {event.get('id', 'unknown')} for user {user_id}: {e}")
+            continue
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global scheduler
+    global scheduler, job_executor, APP_HTTP
     
     print("Loading data from disk...")
     load_data()
+    open_alert_log()
+    get_http_client()
     
-    scheduler = BackgroundScheduler()
+    # Sync jobs go to a dedicated thread pool so shutdown can wait for them;
+    # the asyncio executor has no way to honor wait=True.
+    job_executor = ThreadPoolExecutor()
+    scheduler = AsyncIOScheduler(executors={"default": AsyncIOExecutor(), "threadpool": job_executor})
     scheduler.add_job(safe_update_events, "interval", minutes=30, id="fetch_job")
-    scheduler.add_job(process_events_for_users, "interval", minutes=5, id="process_job")
+    scheduler.add_job(process_events_for_users, "interval", minutes=5, id="process_job", executor="threadpool")
+    scheduler.add_job(flush_state, "interval", seconds=STATE_FLUSH_SECONDS, id="flush_job", executor="threadpool")
     try:
         scheduler.start()
         print("Scheduler started")
-        safe_update_events()
+        await safe_update_events()
     except Exception as e:
         print(f"Failed to start scheduler: {e}")
     
     yield
     
+    # Stop jobs first so no flush or alert append races the final saves.
+    if scheduler and scheduler.running:
+        scheduler.shutdown(wait=True)
+        # AsyncIOScheduler.shutdown only schedules the stop on the loop, so
+        # wait on the pool directly for any process/flush job still running.
+        await asyncio.to_thread(job_executor.shutdown, True)
+        print("Scheduler stopped")
+    
     print("Saving data to disk...")
     save_users()
-    save_alerts()
     save_last_alert()
     save_cache()
+    close_alert_log()
     
-    if scheduler and scheduler.running:
-        scheduler.shutdown(wait=True)
-        print("Scheduler stopped")
+    if APP_HTTP is not None:
+        await APP_HTTP.aclose()
+        APP_HTTP = None
 
 
 app = FastAPI(title="Disaster AI Sentinel", version="1.0", lifespan=lifespan)
 
 
 @app.post("/alerts/subscribe")
-def subscribe_user(req: SubscribeRequest, request: Request):
+async def subscribe_user(req: SubscribeRequest, request: Request):
+    global USERS_DIRTY
     client_ip = request.client.host if request.client else None
     
     lat = req.lat
@@ -527,7 +907,7 @@ def subscribe_user(req: SubscribeRequest, request: Request):
         location = None
         
         if client_ip:
-            location = get_user_location_from_ip(client_ip)
+            location = await get_user_location_from_ip(client_ip)
         
         if location:
             if lat is None:
@@ -549,25 +929,52 @@ def subscribe_user(req: SubscribeRequest, request: Request):
         "lon": lon,
         "subscribed_on": datetime.now(timezone.utc).isoformat(),
     }
-    save_users()
+    upsert_user_coords(req.user_id, float(lat), float(lon))
+    # Written by flush_job, off the event loop.
+    USERS_DIRTY = True
     return {"message": "user subscribed", "user": USERS[req.user_id]}
 
 
+def state_etag(*parts: Any) -> str:
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def conditional_response(request: Request, response: Response, etag: str,
+                         cache_control: str = PRIVATE_CACHE_CONTROL) -> Optional[Response]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in {tag.strip() for tag in if_none_match.split(",")}:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
 @app.get("/alerts")
-def get_alerts(limit: int = 20):
+def get_alerts(request: Request, response: Response, limit: int = 20):
+    not_modified = conditional_response(request, response, state_etag(ALERTS_SEQ, CACHE.get("last_update", ""), limit))
+    if not_modified:
+        return not_modified
+    
     if limit <= 0:
         return []
     if limit > 1000:
         limit = 1000
-    return ALERTS[-limit:]
+    return recent_alerts(limit)
 
 
 @app.get("/alerts/history")
-def get_alert_history(user_id: Optional[str] = None):
+def get_alert_history(request: Request, response: Response, user_id: Optional[str] = None):
+    not_modified = conditional_response(
+        request, response,
+        state_etag(ALERTS_SEQ, CACHE.get("last_update", ""), hashlib.sha1((user_id or "").encode()).hexdigest()[:12]),
+    )
+    if not_modified:
+        return not_modified
+    
     if user_id:
-        filtered = [alert for alert in ALERTS if alert.get("user_id") == user_id]
+        filtered = list(ALERTS_BY_USER.get(user_id, ()))
         return {"user_id": user_id, "count": len(filtered), "alerts": filtered}
-    return {"count": len(ALERTS), "alerts": ALERTS}
+    return {"count": len(ALERTS), "alerts": list(ALERTS)}
 
 
 @app.post("/alerts/push")
@@ -590,8 +997,7 @@ def push_notification(req: PushNotificationRequest):
         "timestamp": datetime.now(timezone.utc).isoformat(),
     }
     
-    ALERTS.append(alert_payload)
-    save_alerts()
+    append_alert(alert_payload)
     
     print(f"Notification sent to {user.get('name', req.user_id)}: {req.message}")
     
@@ -602,19 +1008,31 @@ def push_notification(req: PushNotificationRequest):
 
 
 @app.get("/alerts/test-process")
-def manual_process():
-    safe_update_events()
-    process_events_for_users()
-    return {"message": "processed", "alerts": ALERTS[-10:]}
+async def manual_process():
+    await safe_update_events()
+    # CPU-bound (and may wait on MATCH_LOCK or a cold JIT compile); keep it off the event loop.
+    await asyncio.to_thread(process_events_for_users)
+    return {"message": "processed", "alerts": recent_alerts(10)}
 
 
 @app.get("/health")
-def health_check():
+def health_check(request: Request, response: Response):
+    etag = state_etag(
+        ALERTS_SEQ,
+        CACHE.get("last_update", ""),
+        len(USERS),
+        len(CACHE.get("events_by_id", {})),
+        CACHE.get("consecutive_failures", 0),
+    )
+    not_modified = conditional_response(request, response, etag, RESPONSE_CACHE_CONTROL)
+    if not_modified:
+        return not_modified
+    
     return {
         "status": "ok",
         "last_update": CACHE.get("last_update"),
         "user_count": len(USERS),
         "alerts_count": len(ALERTS),
-        "cached_events": len(CACHE.get("events", [])),
+        "cached_events": len(CACHE.get("events_by_id", {})),
         "offline_mode": CACHE.get("consecutive_failures", 0) > 1,
     }